@@ -3,82 +3,45 @@
 # to both Data/ and docs/Data/.
 # NOTE: For ETH, we ALWAYS recompute "Total" as the sum of all fund columns.
 
-import io
-import re
+import hashlib
 from pathlib import Path
 from typing import List, Tuple, Optional
 
+import numpy as np
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 
-ETH_URL = "https://farside.co.uk/ethereum-etf-flow-all-data/"
-UA = (
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-    "AppleWebKit/537.36 (KHTML, like Gecko) "
-    "Chrome/124.0.0.0 Safari/537.36"
+from farside_common import (
+    clean_num, fetch_if_modified, page_encoding, parse_dates, parse_html, save_validators,
+    table_to_frame, write_frames,
 )
 
+ETH_URL = "https://farside.co.uk/ethereum-etf-flow-all-data/"
+
 # Columns we never include in the Total sum:
-EXCLUDE_COLS = {
+EXCLUDE_COLS = frozenset({
     "date", "total", "eth", "average", "maximum", "minimum",
     "cumulative", "cumulative_usd_millions"
-}
+})
+
+# Tickers that only show up in the daily flow table; lets us skip other tables cheaply
+KNOWN_TICKERS = ("ETHA", "FETH")
 
 REPO_ROOT = Path(__file__).resolve().parent
 DATA_DIR = REPO_ROOT / "Data"
 DOCS_DATA_DIR = REPO_ROOT / "docs" / "Data"
+ETAG_PATH = DATA_DIR / "ethereum_etf_flows.etag"
+LAST_MODIFIED_PATH = DATA_DIR / "ethereum_etf_flows.last_modified"
+DIGEST_PATH = DATA_DIR / "ethereum_etf_flows.sha256"
+OUTPUT_NAMES = (
+    "ethereum_etf_flows_wide_daily.csv",
+    "ethereum_etf_flows_long_daily.csv",
+    "ethereum_etf_totals_daily.csv",
+)
 
 
 # ------------------------- Helpers -------------------------
 
-def _norm(s: str) -> str:
-    s = "" if s is None else str(s)
-    s = s.replace("\xa0", " ").replace("\u2009", " ")
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
-def _norm_cols(cols: List[str]) -> List[str]:
-    return [_norm(c) for c in cols]
-
-
-def _clean_num(x):
-    """Convert table cell to float, handling commas and accounting negatives (parentheses)."""
-    if pd.isna(x):
-        return 0.0
-    s = str(x).strip().replace(",", "").replace("\u2009", "").replace("\xa0", " ")
-    if s in {"", "-", "–", "—"}:
-        return 0.0
-    if s.startswith("(") and s.endswith(")"):
-        s = "-" + s[1:-1]
-    try:
-        return float(s)
-    except Exception:
-        return 0.0
-
-
-def _parse_tables_with_pandas(html_fragment: str) -> List[pd.DataFrame]:
-    """Return DataFrames for a single <table> element using pandas.read_html with two parsers."""
-    dfs: List[pd.DataFrame] = []
-    for flavor in ("lxml", "html5lib"):
-        try:
-            found = pd.read_html(io.StringIO(html_fragment), flavor=flavor, thousands=",")
-            for df in found:
-                if isinstance(df.columns, pd.MultiIndex):
-                    df.columns = [
-                        " ".join([str(x) for x in tup if str(x) != "nan"]).strip()
-                        for tup in df.columns
-                    ]
-                df.columns = _norm_cols(list(df.columns))
-                dfs.append(df)
-            if dfs:
-                break
-        except Exception:
-            continue
-    return dfs
-
-
 def _find_date_col(df: pd.DataFrame) -> Optional[str]:
     """Return the name of the column that holds dates. Prefer 'Date', else detect by parsing."""
     for cand in df.columns:
@@ -105,7 +68,7 @@ def _score_table(df: pd.DataFrame) -> tuple[int, int]:
             continue
         # Heuristic: if after cleaning, many cells look numeric
         try:
-            vals = pd.Series(df[c]).map(_clean_num)
+            vals = clean_num(pd.Series(df[c]))
             if (vals != 0).mean() > 0.2:
                 n_num_cols += 1
         except Exception:
@@ -113,27 +76,29 @@ def _score_table(df: pd.DataFrame) -> tuple[int, int]:
     return (n_rows, n_num_cols)
 
 
-def _pick_main_daily_table(soup: BeautifulSoup) -> Optional[pd.DataFrame]:
+def _pick_main_daily_table(tree: lxml_html.HtmlElement) -> Optional[pd.DataFrame]:
     """Among all <table> elements, pick the one most likely to be the daily flow table."""
     best, best_score = None, (-1, -1)
-    for tbl in soup.find_all("table"):
-        for df in _parse_tables_with_pandas(str(tbl)):
-            date_col = _find_date_col(df)
-            if not date_col:
-                continue
-            score = _score_table(df)
-            if score > best_score:
-                best, best_score = df, score
+    tables = tree.xpath("//table")
+    # Only build frames for tables mentioning a known ticker (fall back to all)
+    candidates = [t for t in tables if any(k in t.text_content() for k in KNOWN_TICKERS)]
+    for tbl in candidates or tables:
+        df = table_to_frame(tbl)
+        tbl.clear()  # cells are copied out; free the subtree right away
+        if df is None:
+            continue
+        date_col = _find_date_col(df)
+        if not date_col:
+            continue
+        score = _score_table(df)
+        if score > best_score:
+            best, best_score = df, score
     return best
 
 
-def _load_raw_table(url: str = ETH_URL) -> pd.DataFrame:
-    s = requests.Session()
-    s.headers.update({"User-Agent": UA})
-    r = s.get(url, timeout=30)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
-    df = _pick_main_daily_table(soup)
+def _load_raw_table(html: bytes, encoding: str) -> pd.DataFrame:
+    tree = parse_html(html, encoding)
+    df = _pick_main_daily_table(tree)
     if df is None:
         raise RuntimeError("Could not find the main daily table on Farside (no date-like column).")
     return df
@@ -148,20 +113,22 @@ def _tidy_wide(df_raw: pd.DataFrame) -> pd.DataFrame:
     date_col = _find_date_col(df)
     if not date_col:
         raise RuntimeError("Found table but couldn't detect a date column.")
-    df["date"] = pd.to_datetime(df[date_col], dayfirst=True, errors="coerce")
+    df["date"] = parse_dates(df[date_col])
     df = df[df["date"].notna()].drop(columns=[date_col])
 
     # Numeric conversion
     for c in list(df.columns):
         if c == "date":
             continue
-        df[c] = pd.Series(df[c]).map(_clean_num)
+        df[c] = clean_num(df[c])
 
     # Always recompute Total for ETH as the sum of fund columns
-    fund_cols = [c for c in df.columns if c.lower() not in EXCLUDE_COLS and c != "date"]
+    fund_cols = [c for c in df.columns if c.lower() not in EXCLUDE_COLS]
     if not fund_cols:
         raise RuntimeError("No fund columns detected to sum for Total.")
-    df["Total"] = df[fund_cols].sum(axis=1)
+    # Column-major so each fund column is contiguous for the reduction
+    arr = np.asfortranarray(df.loc[:, fund_cols].to_numpy(np.float64))
+    df["Total"] = arr.sum(axis=1)
 
     # Sort by date ascending
     df = df.sort_values("date").reset_index(drop=True)
@@ -169,60 +136,84 @@ def _tidy_wide(df_raw: pd.DataFrame) -> pd.DataFrame:
 
 
 def _force_daily_zero_fill(df_wide: pd.DataFrame) -> pd.DataFrame:
-    full = pd.date_range(df_wide["date"].min(), df_wide["date"].max(), freq="D")
-    df = (
-        df_wide.set_index("date")
-        .reindex(full)
-        .fillna(0.0)
-        .rename_axis("date")
-        .reset_index()
-    )
+    cols = [c for c in df_wide.columns if c != "date"]
+    days = df_wide["date"].to_numpy().astype("datetime64[D]")
+    # A scatter would silently keep only the last row of a repeated date
+    dup = np.diff(days) == 0
+    if dup.any():
+        repeated = sorted(set(days[1:][dup].astype(str).tolist()))
+        raise ValueError(f"Duplicate dates in the daily table: {repeated}")
+    full = np.arange(days.min(), days.max() + np.timedelta64(1, "D"), dtype="datetime64[D]")
+    # `full` is a sorted calendar, so searchsorted gives each row its slot (no hash reindex)
+    out = np.zeros((len(full), len(cols)), dtype=np.float64)
+    out[np.searchsorted(full, days)] = df_wide[cols].to_numpy(np.float64)
+    df = pd.DataFrame(out, columns=cols)
+    df.insert(0, "date", full.astype("datetime64[ns]"))
     return df
 
 
-def build_outputs() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    raw = _load_raw_table(ETH_URL)
+def build_outputs(
+    html: bytes, encoding: str = "utf-8"
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    raw = _load_raw_table(html, encoding)
     wide = _tidy_wide(raw)
     wide = _force_daily_zero_fill(wide)
+    # Format dates as YYYY-MM-DD once; totals and long_ inherit the strings
+    wide["date"] = wide["date"].dt.strftime("%Y-%m-%d")
 
     # totals-only (plus cumulative)
     totals = wide[["date", "Total"]].rename(columns={"Total": "total_usd_millions"}).copy()
     totals["cumulative_usd_millions"] = totals["total_usd_millions"].cumsum()
 
     # long (tidy)
-    melt_cols = [c for c in wide.columns if c not in {"date", "Total"}]
-    long_ = wide.melt(
-        id_vars="date", value_vars=melt_cols, var_name="fund", value_name="flow_usd_millions"
-    )
+    # Every non-date column except Total (columns excluded from Total still get long rows)
+    melt_cols = wide.columns.drop(["date", "Total"])
+    # Same fund-major order as DataFrame.melt, built as a plain buffer reshape
+    long_ = pd.DataFrame({
+        "date": np.tile(wide["date"].to_numpy(), len(melt_cols)),
+        "fund": np.repeat(np.asarray(melt_cols, dtype=object), len(wide)),
+        "flow_usd_millions": wide[melt_cols].to_numpy(np.float64).ravel(order="F"),
+    })
 
     return wide, long_, totals
 
 
 # ------------------------- I/O -------------------------
 
-def _write_both_paths(df: pd.DataFrame, rel_name: str):
-    """Write a CSV into both Data/ and docs/Data/."""
+def _write_both_paths(frames: List[Tuple[pd.DataFrame, str]]):
+    """Write each CSV into both Data/ and docs/Data/ (all files in parallel)."""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     DOCS_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-    p1 = DATA_DIR / rel_name
-    p2 = DOCS_DATA_DIR / rel_name
-
-    df.to_csv(p1, index=False)
-    df.to_csv(p2, index=False)
-    print(f"Wrote: {p1.relative_to(REPO_ROOT)}  and  {p2.relative_to(REPO_ROOT)}")
+    write_frames([(df, d / rel_name) for df, rel_name in frames for d in (DATA_DIR, DOCS_DATA_DIR)])
+    for _, rel_name in frames:
+        p1 = DATA_DIR / rel_name
+        p2 = DOCS_DATA_DIR / rel_name
+        print(f"Wrote: {p1.relative_to(REPO_ROOT)}  and  {p2.relative_to(REPO_ROOT)}")
 
 
 def write_csvs():
-    wide, long_, totals = build_outputs()
-
-    # Format dates as YYYY-MM-DD for clean CSVs
-    for df in (wide, long_, totals):
-        df["date"] = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
-
-    _write_both_paths(wide, "ethereum_etf_flows_wide_daily.csv")
-    _write_both_paths(long_, "ethereum_etf_flows_long_daily.csv")
-    _write_both_paths(totals, "ethereum_etf_totals_daily.csv")
+    outputs = [d / name for name in OUTPUT_NAMES for d in (DATA_DIR, DOCS_DATA_DIR)]
+    r = fetch_if_modified(ETH_URL, outputs, ETAG_PATH, LAST_MODIFIED_PATH)
+    if r is None:
+        print("Farside page not modified since last run; CSVs left as is.")
+        return
+    # Catches an unchanged page even when Farside ignores the conditional headers;
+    # only trusted while every output is still on disk
+    digest = hashlib.sha256(r.content).hexdigest()
+    if (
+        all(p.exists() for p in outputs)
+        and DIGEST_PATH.exists()
+        and DIGEST_PATH.read_text(encoding="utf-8").strip() == digest
+    ):
+        print("Farside page unchanged since last run; CSVs left as is.")
+        return
+
+    wide, long_, totals = build_outputs(r.content, page_encoding(r))
+
+    _write_both_paths(list(zip((wide, long_, totals), OUTPUT_NAMES)))
+    save_validators(r, ETAG_PATH, LAST_MODIFIED_PATH)
+    DIGEST_PATH.write_text(digest, encoding="utf-8")
 
 
 if __name__ == "__main__":
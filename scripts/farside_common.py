@@ -0,0 +1,231 @@
+# farside_common.py
+# Shared fetch / parse / CSV-write helpers for the BTC and ETH Farside scrapers.
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import requests
+from lxml import html as lxml_html
+from requests.adapters import HTTPAdapter
+
+UA = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/124.0.0.0 Safari/537.36"
+)
+
+# One keep-alive session for every request to farside.co.uk, so chained
+# BTC + ETH runs reuse the same TCP/TLS connection.
+_SESSION = requests.Session()
+_SESSION.headers["User-Agent"] = UA
+_SESSION.headers["Accept-Encoding"] = "gzip, deflate"
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+_SESSION.mount("https://", _adapter)
+_SESSION.mount("http://", _adapter)
+
+
+def fetch_if_modified(
+    url: str, outputs: List[Path], etag_path: Path, last_modified_path: Path
+) -> Optional[requests.Response]:
+    """GET url conditionally on the previous run's output.
+
+    Sends If-None-Match / If-Modified-Since with the ETag and Last-Modified saved
+    by save_validators, but only when every file in outputs still exists (so a
+    deleted CSV always triggers a rebuild). Returns None if Farside answers 304.
+    """
+    headers = {}
+    if all(p.exists() for p in outputs):
+        if etag_path.exists():
+            headers["If-None-Match"] = etag_path.read_text(encoding="utf-8").strip()
+        if last_modified_path.exists():
+            headers["If-Modified-Since"] = last_modified_path.read_text(encoding="utf-8").strip()
+    r = _SESSION.get(url, headers=headers, timeout=30)
+    if r.status_code == 304:
+        return None
+    r.raise_for_status()
+    return r
+
+
+def save_validators(r: requests.Response, etag_path: Path, last_modified_path: Path):
+    """Remember the response ETag / Last-Modified for the next conditional GET.
+
+    Call only after the CSVs are written. A validator the server no longer sends
+    is removed so a stale value is never replayed.
+    """
+    for header, path in (("ETag", etag_path), ("Last-Modified", last_modified_path)):
+        value = r.headers.get(header)
+        if value:
+            path.write_text(value, encoding="utf-8")
+        elif path.exists():
+            path.unlink()
+
+
+def page_encoding(r: requests.Response) -> str:
+    """Charset declared in the Content-Type header, else UTF-8.
+
+    requests falls back to ISO-8859-1 for text/html without a charset, which would
+    mangle thin spaces and unicode minus signs in the flow cells.
+    """
+    if "charset=" in r.headers.get("Content-Type", "").lower() and r.encoding:
+        return r.encoding
+    return "utf-8"
+
+
+def parse_html(html: bytes, encoding: str = "utf-8") -> lxml_html.HtmlElement:
+    """Parse a fetched page, decoding the bytes with the given (HTTP) encoding."""
+    # huge_tree lifts libxml2's node/depth limits that the all-data tables can hit;
+    # recover keeps going through Farside's occasionally malformed markup.
+    parser = lxml_html.HTMLParser(
+        encoding=encoding, huge_tree=True, recover=True, remove_comments=True
+    )
+    return lxml_html.fromstring(html, parser=parser)
+
+
+_WS = re.compile(r"\s+")
+_WS_TRANS = str.maketrans({"\xa0": " ", "\u2009": " "})
+
+
+def _norm(s: str) -> str:
+    s = "" if s is None else str(s)
+    return _WS.sub(" ", s.translate(_WS_TRANS)).strip()
+
+
+def _span(cell: lxml_html.HtmlElement, attr: str) -> int:
+    try:
+        return max(1, int(cell.get(attr, 1)))
+    except ValueError:
+        return 1
+
+
+def _expand_spans(trs: List[lxml_html.HtmlElement]) -> List[List[str]]:
+    """Cell text per row, with colspan cells repeated and rowspan cells carried down."""
+    rows: List[List[str]] = []
+    carried: List[Tuple[int, str, int]] = []  # (column, text, rows still to fill)
+    for tr in trs:
+        texts: List[str] = []
+        next_carried: List[Tuple[int, str, int]] = []
+        col = 0
+        for cell in tr.iterchildren("td", "th"):
+            while carried and carried[0][0] <= col:
+                _, text, left = carried.pop(0)
+                texts.append(text)
+                if left > 1:
+                    next_carried.append((col, text, left - 1))
+                col += 1
+            text = _norm(cell.text_content())
+            rowspan = _span(cell, "rowspan")
+            for _ in range(_span(cell, "colspan")):
+                texts.append(text)
+                if rowspan > 1:
+                    next_carried.append((col, text, rowspan - 1))
+                col += 1
+        for _, text, left in carried:
+            texts.append(text)
+            if left > 1:
+                next_carried.append((col, text, left - 1))
+            col += 1
+        carried = next_carried
+        if texts:
+            rows.append(texts)
+    return rows
+
+
+def _dedup_names(names: List[str]) -> List[str]:
+    """Rename repeated labels to X, X.1, X.2, ... exactly as pandas.read_html does."""
+    counts: Dict[str, int] = {}
+    out: List[str] = []
+    for name in names:
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        out.append(name)
+        counts[name] = count + 1
+    return out
+
+
+def _table_rows(tbl: lxml_html.HtmlElement) -> Tuple[List[str], List[List[str]]]:
+    """Split a <table> element into (header, body rows) of normalized cell text.
+
+    Follows pandas.read_html: <thead> rows are the header whatever their cell tags,
+    otherwise leading all-<th> rows are; <tfoot> rows go after the body. A
+    multi-row header is joined per column and repeated labels get .1, .2, ...
+    """
+    head_trs: List[lxml_html.HtmlElement] = []
+    body_trs: List[lxml_html.HtmlElement] = []
+    foot_trs: List[lxml_html.HtmlElement] = []
+    for tr in tbl.iter("tr"):
+        section = tr.getparent().tag
+        if section == "thead":
+            head_trs.append(tr)
+        elif section == "tfoot":
+            foot_trs.append(tr)
+        else:
+            body_trs.append(tr)
+    if not head_trs:
+        while body_trs:
+            cells = list(body_trs[0].iterchildren("td", "th"))
+            if not cells or any(c.tag != "th" for c in cells):
+                break
+            head_trs.append(body_trs.pop(0))
+
+    head = _expand_spans(head_trs)
+    body = _expand_spans(body_trs) + _expand_spans(foot_trs)
+    if not head and body:
+        head.append(body.pop(0))
+    width = max((len(r) for r in head + body), default=0)
+    header = [
+        " ".join(h[i] for h in head if i < len(h) and h[i]).strip() or f"Unnamed: {i}"
+        for i in range(width)
+    ]
+    # A colspan header cell (or two equal labels) must not yield duplicate columns
+    return _dedup_names(header), body
+
+
+def table_to_frame(tbl: lxml_html.HtmlElement) -> Optional[pd.DataFrame]:
+    """Build a DataFrame for a single <table> element straight from its cells (no read_html)."""
+    header, body = _table_rows(tbl)
+    if not body:
+        return None
+    width = len(header)
+    rows = [(r + [""] * width)[:width] for r in body]
+    return pd.DataFrame(rows, columns=header)
+
+
+# Separators (incl. the spaces _norm leaves for thin/no-break spaces) and footnote
+# stars removed, unicode minus -> "-", in one C-level scan per cell
+_NUM_TRANS = str.maketrans({",": "", " ": "", "\u2009": "", "\u00a0": "", "*": "", "−": "-"})
+_PAREN_RE = re.compile(r"^\((.+)\)$")  # accounting negative
+
+
+def clean_num(col: pd.Series) -> pd.Series:
+    """Convert a column of table cells to floats, handling commas and accounting negatives (parentheses).
+
+    Vectorized over the whole column; blanks, dashes and anything unparsable become 0.
+    """
+    s = col.astype(str).str.translate(_NUM_TRANS).str.strip()
+    s = s.str.replace(_PAREN_RE, r"-\1", regex=True)
+    return pd.to_numeric(s, errors="coerce").fillna(0.0)
+
+
+def parse_dates(col: pd.Series) -> pd.Series:
+    """Parse Farside's date column; footer rows (Total, Average, ...) come back NaT.
+
+    Dates are uniformly "11 Jan 2024", so a fixed format (cached) avoids dateutil per
+    cell; only the rows it misses are re-parsed dayfirst, so variants like
+    "1 Sept 2024" are not mistaken for footers and zero-filled away.
+    """
+    dates = pd.to_datetime(col, format="%d %b %Y", errors="coerce", cache=True)
+    missed = dates.isna()
+    if missed.any():
+        dates[missed] = pd.to_datetime(col[missed], format="mixed", dayfirst=True, errors="coerce")
+    return dates
+
+
+def write_frames(jobs: List[Tuple[pd.DataFrame, Path]]):
+    """Write each (DataFrame, path) pair to CSV concurrently; the writes are independent and I/O-bound."""
+    with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+        list(ex.map(lambda job: job[0].to_csv(job[1], index=False), jobs))
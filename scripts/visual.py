@@ -2,8 +2,9 @@
 # Read totals CSVs from Data/ and create bar+line charts into Data/Charts/.
 from pathlib import Path
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless batch job: skip GUI backend probing
 import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 
 # --- Locations (kept simple and stable) ---
 REPO_DIR = Path(__file__).resolve().parent
@@ -16,37 +17,30 @@ FILES = [
 ]
 
 def load_totals(csv_path: Path) -> pd.DataFrame:
-    df = pd.read_csv(csv_path)
-
-    # Defensive: normalize column names we expect from your generator scripts
-    # Required: date, total_usd_millions; Optional: cumulative_usd_millions
-    cols = {c.lower(): c for c in df.columns}
-
-    if "date" not in cols:
-        raise ValueError(f"'date' column not found in {csv_path.name}")
-
-    # Prefer a strict parse; your files are YYYY-MM-DD
-    df[cols["date"]] = pd.to_datetime(df[cols["date"]], format="%Y-%m-%d", errors="coerce")
-    if df[cols["date"]].isna().any():
-        # fallback if needed
-        df[cols["date"]] = pd.to_datetime(df[cols["date"]], errors="coerce")
-
-    # Total column may already be named 'total_usd_millions'; if not, try 'total'
-    total_col = cols.get("total_usd_millions") or cols.get("total")
-    if not total_col:
-        raise ValueError(f"'total_usd_millions' (or 'Total') column not found in {csv_path.name}")
-
-    df = df.rename(columns={total_col: "total_usd_millions", cols["date"]: "date"})
-
-    # If cumulative not present, build it
-    if "cumulative_usd_millions" not in df.columns:
-        df["cumulative_usd_millions"] = df["total_usd_millions"].cumsum()
+    # Your generator scripts always write these three columns, dates as YYYY-MM-DD
+    try:
+        df = pd.read_csv(
+            csv_path,
+            usecols=["date", "total_usd_millions", "cumulative_usd_millions"],
+            dtype={"total_usd_millions": "float64", "cumulative_usd_millions": "float64"},
+            parse_dates=["date"],
+            date_format="%Y-%m-%d",
+        )
+    except ValueError as e:
+        # Raised for missing columns (usecols) and for non-numeric totals (dtype)
+        raise ValueError(f"Could not load {csv_path.name} (missing columns or bad values): {e}") from e
+
+    # With date_format, a single unparsable date leaves the column as strings
+    if not pd.api.types.is_datetime64_any_dtype(df["date"]):
+        raise ValueError(f"'date' column in {csv_path.name} is not all YYYY-MM-DD")
 
     # Sort by date just in case
     df = df.sort_values("date").reset_index(drop=True)
     return df[["date", "total_usd_millions", "cumulative_usd_millions"]]
 
 def plot_asset(name: str, df: pd.DataFrame):
+    import matplotlib.dates as mdates
+
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
     # Split daily flows into positive (inflow) and negative (outflow) parts